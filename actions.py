@@ -2,346 +2,685 @@
 Actions module for Gmail Rules Manager
 """
 
-from auth import get_gmail_service
-from db import get_session, Email, log_action, get_email_by_id
+import asyncio
+import threading
+
+from auth import get_gmail_service, get_authorized_http, refresh_service_if_expired
+from sqlalchemy import select
+
+from db import session_scope, Email, ActionLogBuffer, log_action, get_email_by_id
+from retry import gmail_execute, execute_batch
 from config import DRY_RUN
 
+# Maximum number of Gmail API calls in flight at once. messages.modify
+# costs 5 quota units against a 250 units/sec per-user limit, so 10
+# concurrent calls stays well clear of rate limiting.
+MAX_CONCURRENT_ACTIONS = 10
+
+# Cache of lowercased label name -> Gmail label ID, populated lazily on
+# the first lookup so a run with many move actions lists labels once
+_LABEL_CACHE = {}
+_LABEL_CACHE_LOCK = threading.Lock()
+
+def _get_label_id(service, name):
+    """
+    Resolve a label name to its Gmail label ID.
+
+    The full label list is fetched once per process and cached; labels
+    that don't exist yet are created and added to the cache.
+
+    Args:
+        service: The authenticated Gmail API service object
+        name (str): Label name to resolve
+
+    Returns:
+        str: The Gmail label ID
+    """
+    key = name.lower()
+
+    with _LABEL_CACHE_LOCK:
+        # Populate the cache on first use
+        if not _LABEL_CACHE:
+            results = gmail_execute(service.users().labels().list(userId='me'))
+            for label in results.get('labels', []):
+                _LABEL_CACHE[label['name'].lower()] = label['id']
+
+        label_id = _LABEL_CACHE.get(key)
+
+        # Create the label if it doesn't exist
+        if not label_id:
+            label = gmail_execute(service.users().labels().create(
+                userId='me',
+                body={
+                    'name': name,
+                    'labelListVisibility': 'labelShow',
+                    'messageListVisibility': 'show'
+                }
+            ))
+            label_id = label['id']
+            _LABEL_CACHE[key] = label_id
+
+        return label_id
+
+def invalidate_label_cache():
+    """Clear the cached label name -> ID mapping."""
+    with _LABEL_CACHE_LOCK:
+        _LABEL_CACHE.clear()
+
+def _needs_modify(action_type, is_read=False, labels=None, label_id=None):
+    """
+    Check whether a Gmail modify call would actually change anything.
+
+    Idempotent rule runs tend to re-apply actions to emails already in
+    the target state; skipping those locally saves a full HTTPS round
+    trip per no-op.
+
+    Args:
+        action_type (str): One of the supported action types
+        is_read (bool): Current read state of the email
+        labels (set): Current label set of the email
+        label_id (str): Resolved destination label ID for move_message
+
+    Returns:
+        bool: True if the email's current state requires the call
+    """
+    if action_type == 'mark_as_read':
+        return not is_read
+    if action_type == 'mark_as_unread':
+        return is_read
+    if action_type == 'move_message':
+        labels = labels or set()
+        return label_id not in labels or 'INBOX' in labels
+    return True
+
 def execute_actions(email_actions):
     """
     Execute actions on emails.
-    
+
     Args:
         email_actions (dict): Dictionary mapping email IDs to applicable actions
-        
+
     Returns:
         dict: Dictionary mapping email IDs to action results
     """
-    results = {}
-    
-    for email_id, actions in email_actions.items():
-        results[email_id] = []
-        
-        for action_info in actions:
-            action = action_info['action']
-            rule_id = action_info['rule_id']
-            
-            action_type = action['type']
-            result = None
-            
+    return asyncio.run(_execute_actions_async(email_actions))
+
+async def _execute_actions_async(email_actions):
+    """
+    Execute actions on emails concurrently.
+
+    Each action is network I/O bound (one Gmail modify call), so the
+    actions are fanned out with asyncio.gather instead of being run one
+    round trip at a time. Concurrency is capped by a semaphore to stay
+    within Gmail's per-user rate limits.
+
+    Args:
+        email_actions (dict): Dictionary mapping email IDs to applicable actions
+
+    Returns:
+        dict: Dictionary mapping email IDs to action results
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_ACTIONS)
+
+    # Pre-load every needed Email row with a single SELECT ... IN query
+    # instead of one SELECT per action inside the handlers
+    with session_scope() as session:
+        emails = {
+            email.id: email
+            for email in session.execute(
+                select(Email).where(Email.id.in_(list(email_actions)))
+            ).scalars()
+        }
+
+    async def run_action(email_id, applied):
+        action = applied.action
+        rule_id = applied.rule_id
+
+        action_type = action['type']
+        email_obj = emails.get(email_id)
+
+        async with semaphore:
             # Execute the appropriate action
             if action_type == 'mark_as_read':
-                result = mark_as_read(email_id, rule_id)
+                return await mark_as_read(email_id, rule_id, email_obj=email_obj)
             elif action_type == 'mark_as_unread':
-                result = mark_as_unread(email_id, rule_id)
+                return await mark_as_unread(email_id, rule_id, email_obj=email_obj)
             elif action_type == 'move_message':
                 destination = action.get('destination', '')
-                result = move_message(email_id, destination, rule_id)
+                return await move_message(email_id, destination, rule_id,
+                                          email_obj=email_obj)
             else:
-                result = {
+                return {
                     'success': False,
                     'message': f"Unknown action type: {action_type}"
                 }
-            
-            results[email_id].append(result)
-    
+
+    # Build one coroutine per action, remembering which email each
+    # result belongs to so the results dict keeps its original shape
+    keys = []
+    coros = []
+    for email_id, actions in email_actions.items():
+        for applied in actions:
+            keys.append(email_id)
+            coros.append(run_action(email_id, applied))
+
+    # Re-auth up front if needed so the fan-out doesn't race the OAuth flow
+    refresh_service_if_expired()
+
+    # Buffer log rows so the whole run commits them in one bulk insert
+    log_buffer = ActionLogBuffer()
+    log_buffer.activate()
+    try:
+        results_list = await asyncio.gather(*coros, return_exceptions=True)
+    finally:
+        log_buffer.deactivate()
+        with session_scope() as session:
+            log_buffer.flush(session)
+
+    results = {email_id: [] for email_id in email_actions}
+    for email_id, result in zip(keys, results_list):
+        if isinstance(result, Exception):
+            result = {
+                'success': False,
+                'message': f"Error: {str(result)}"
+            }
+        results[email_id].append(result)
+
+    return results
+
+async def _execute_request(request):
+    """
+    Run a blocking Gmail API request in a worker thread.
+
+    The request goes through gmail_execute, so rate-limit and transient
+    server errors are retried with backoff. The transport is resolved
+    inside the worker thread: the request objects are built on the
+    event-loop thread, and executing them over that thread's transport
+    would funnel every concurrent call through one shared connection.
+
+    Args:
+        request: A googleapiclient request object (not yet executed)
+
+    Returns:
+        dict: The API response
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, lambda: gmail_execute(request, http=get_authorized_http()))
+
+def execute_actions_batched(email_actions):
+    """
+    Execute actions on emails using Gmail batch requests.
+
+    Instead of one HTTP round trip per action, all modify operations are
+    coalesced into batch HTTP requests of up to 100 sub-requests each,
+    so N actions cost about N/100 round trips. Destination labels for
+    move actions are resolved once up front rather than per message.
+
+    Args:
+        email_actions (dict): Dictionary mapping email IDs to applicable actions
+
+    Returns:
+        dict: Dictionary mapping email IDs to action results
+    """
+    results = {email_id: [] for email_id in email_actions}
+
+    # Buffer log rows so the whole run commits them in one bulk insert;
+    # flushing in the finally keeps rows logged before a mid-run failure
+    # from being discarded with the buffer
+    log_buffer = ActionLogBuffer()
+    log_buffer.activate()
+    try:
+        return _execute_batched(email_actions, results)
+    finally:
+        log_buffer.deactivate()
+        with session_scope() as session:
+            log_buffer.flush(session)
+
+def _execute_batched(email_actions, results):
+    """Body of execute_actions_batched, run with a log buffer active."""
+    # Load the affected emails once up front with a single SELECT ... IN
+    emails = {}
+    with session_scope() as session:
+        rows = session.execute(
+            select(Email).where(Email.id.in_(list(email_actions)))
+        ).scalars()
+        for email in rows:
+            emails[email.id] = {
+                'message_id': email.message_id,
+                'subject': email.subject,
+                'is_read': email.is_read,
+                'labels': set(email.labels.split(',')) if email.labels else set()
+            }
+
+    service = None
+
+    # Resolve destination labels once for the whole run
+    destinations = set()
+    for actions in email_actions.values():
+        for applied in actions:
+            if applied.action['type'] == 'move_message':
+                destinations.add(applied.action.get('destination', ''))
+
+    label_ids = {}
+    if destinations and not DRY_RUN:
+        service = get_gmail_service()
+        for destination in destinations:
+            label_ids[destination] = _get_label_id(service, destination)
+
+    # Build one pending entry per action; each carries everything needed
+    # to construct the sub-request and to update the database afterwards
+    pending = []
+
+    for email_id, actions in email_actions.items():
+        for applied in actions:
+            action = applied.action
+            rule_id = applied.rule_id
+            action_type = action['type']
+
+            email_data = emails.get(email_id)
+            if not email_data:
+                results[email_id].append({
+                    'success': False,
+                    'message': f"Email with ID {email_id} not found"
+                })
+                continue
+
+            subject = email_data['subject']
+
+            if action_type == 'mark_as_read':
+                if not _needs_modify('mark_as_read', is_read=email_data['is_read']):
+                    log_action(email_id, action_type, rule_id,
+                              f"Email '{subject}' is already marked as read")
+                    results[email_id].append({
+                        'success': True,
+                        'message': f"Email is already marked as read"
+                    })
+                    continue
+                body = {'removeLabelIds': ['UNREAD']}
+                details = f"Marked email '{subject}' as read"
+            elif action_type == 'mark_as_unread':
+                if not _needs_modify('mark_as_unread', is_read=email_data['is_read']):
+                    log_action(email_id, action_type, rule_id,
+                              f"Email '{subject}' is already marked as unread")
+                    results[email_id].append({
+                        'success': True,
+                        'message': f"Email is already marked as unread"
+                    })
+                    continue
+                body = {'addLabelIds': ['UNREAD']}
+                details = f"Marked email '{subject}' as unread"
+            elif action_type == 'move_message':
+                destination = action.get('destination', '')
+                label_id = label_ids.get(destination)
+                if not DRY_RUN and not _needs_modify(
+                        'move_message', labels=email_data['labels'], label_id=label_id):
+                    log_action(email_id, action_type, rule_id,
+                              f"Email '{subject}' is already in '{destination}'")
+                    results[email_id].append({
+                        'success': True,
+                        'message': f"Email is already in '{destination}'"
+                    })
+                    continue
+                body = {
+                    'addLabelIds': [label_id],
+                    'removeLabelIds': ['INBOX']
+                }
+                details = f"Moved email '{subject}' to '{destination}'"
+            else:
+                results[email_id].append({
+                    'success': False,
+                    'message': f"Unknown action type: {action_type}"
+                })
+                continue
+
+            if DRY_RUN:
+                dry_details = details.replace('Marked', 'Would mark') \
+                                     .replace('Moved', 'Would move') + " (DRY RUN)"
+                log_action(email_id, action_type, rule_id, dry_details)
+                results[email_id].append({
+                    'success': True,
+                    'message': dry_details
+                })
+                continue
+
+            pending.append({
+                'key': f"{email_id}:{action_type}:{rule_id}",
+                'email_id': email_id,
+                'action': action,
+                'action_type': action_type,
+                'rule_id': rule_id,
+                'message_id': email_data['message_id'],
+                'body': body,
+                'details': details
+            })
+
+    if not pending:
+        return results
+
+    if service is None:
+        service = get_gmail_service()
+
+    # Fire the modify calls in batches (with retry on throttling),
+    # collecting per-subrequest errors
+    errors = {}
+
+    def collect_result(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+
+    requests = {
+        entry['key']: service.users().messages().modify(
+            userId='me',
+            id=entry['message_id'],
+            body=entry['body']
+        )
+        for entry in pending
+    }
+    execute_batch(service, requests, collect_result)
+
+    # Apply database updates and log each action
+    with session_scope() as session:
+        for entry in pending:
+            email_id = entry['email_id']
+            action_type = entry['action_type']
+            rule_id = entry['rule_id']
+
+            exception = errors.get(entry['key'])
+            if exception is not None:
+                log_action(email_id, action_type, rule_id,
+                          f"Failed to perform '{action_type}'",
+                          success=False,
+                          error_message=str(exception))
+                results[email_id].append({
+                    'success': False,
+                    'message': f"Error: {str(exception)}"
+                })
+                continue
+
+            email = session.get(Email, email_id)
+            if email:
+                if action_type == 'mark_as_read':
+                    email.is_read = True
+                elif action_type == 'mark_as_unread':
+                    email.is_read = False
+                elif action_type == 'move_message':
+                    labels = set(email.labels.split(',')) if email.labels else set()
+                    labels.discard('INBOX')
+                    destination = entry['action'].get('destination', '')
+                    label_id = label_ids.get(destination)
+                    if label_id:
+                        labels.add(label_id)
+                    email.labels = ','.join(sorted(labels))
+
+            log_action(email_id, action_type, rule_id, entry['details'])
+            results[email_id].append({
+                'success': True,
+                'message': entry['details']
+            })
+
     return results
 
-def mark_as_read(email_id, rule_id):
+async def mark_as_read(email_id, rule_id, email_obj=None):
     """
     Mark an email as read.
-    
+
     Args:
         email_id (int): ID of the email in the database
         rule_id (str): ID of the rule that triggered this action
-        
+        email_obj (Email): Pre-fetched Email row to reuse; loaded by ID
+                           when omitted
+
     Returns:
         dict: Result of the action
     """
-    session = get_session()
-    
-    try:
-        # Get email from database
-        email = session.query(Email).filter(Email.id == email_id).first()
-        
+    with session_scope() as session:
+        # Reuse the pre-fetched row if the dispatcher provided one,
+        # otherwise fall back to a primary-key lookup
+        if email_obj is not None:
+            email = session.merge(email_obj, load=False)
+        else:
+            email = session.get(Email, email_id)
+
         if not email:
             return {
                 'success': False,
                 'message': f"Email with ID {email_id} not found"
             }
-        
-        # Store necessary data before closing session
-        message_id = email.message_id
+
         subject = email.subject
-        is_already_read = email.is_read
-        
-    finally:
-        session.close()
-    
-    # Proceed with the action
-    if DRY_RUN:
-        log_action(email_id, 'mark_as_read', rule_id, 
-                  f"Would mark email '{subject}' as read (DRY RUN)")
-        
-        return {
-            'success': True,
-            'message': f"Would mark email '{subject}' as read (DRY RUN)"
-        }
-    
-    # If email is already read, skip
-    if is_already_read:
-        log_action(email_id, 'mark_as_read', rule_id, 
-                  f"Email '{subject}' is already marked as read")
-        
-        return {
-            'success': True,
-            'message': f"Email is already marked as read"
-        }
-    
-    try:
-        # Mark as read in Gmail
-        service = get_gmail_service()
-        service.users().messages().modify(
-            userId='me',
-            id=message_id,
-            body={'removeLabelIds': ['UNREAD']}
-        ).execute()
-        
-        # Update database
-        session = get_session()
+
+        if DRY_RUN:
+            log_action(email_id, 'mark_as_read', rule_id,
+                      f"Would mark email '{subject}' as read (DRY RUN)",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Would mark email '{subject}' as read (DRY RUN)"
+            }
+
+        # If email is already read, skip
+        if not _needs_modify('mark_as_read', is_read=email.is_read):
+            log_action(email_id, 'mark_as_read', rule_id,
+                      f"Email '{subject}' is already marked as read",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Email is already marked as read"
+            }
+
         try:
-            email = session.query(Email).filter(Email.id == email_id).first()
-            if email:
-                email.is_read = True
-                session.commit()
-        finally:
-            session.close()
-        
-        # Log action
-        log_action(email_id, 'mark_as_read', rule_id, 
-                  f"Marked email '{subject}' as read")
-        
-        return {
-            'success': True,
-            'message': f"Marked email as read"
-        }
-    
-    except Exception as e:
-        # Log error
-        log_action(email_id, 'mark_as_read', rule_id, 
-                  f"Failed to mark email as read", 
-                  success=False, 
-                  error_message=str(e))
-        
-        return {
-            'success': False,
-            'message': f"Error: {str(e)}"
-        }
+            # Mark as read in Gmail
+            service = get_gmail_service()
+            await _execute_request(service.users().messages().modify(
+                userId='me',
+                id=email.message_id,
+                body={'removeLabelIds': ['UNREAD']}
+            ))
+
+            # Update database and log in the same transaction
+            email.is_read = True
+            log_action(email_id, 'mark_as_read', rule_id,
+                      f"Marked email '{subject}' as read",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Marked email as read"
+            }
+
+        except Exception as e:
+            # Log error
+            log_action(email_id, 'mark_as_read', rule_id,
+                      f"Failed to mark email as read",
+                      success=False,
+                      error_message=str(e),
+                      session=session)
+
+            return {
+                'success': False,
+                'message': f"Error: {str(e)}"
+            }
 
-def mark_as_unread(email_id, rule_id):
+async def mark_as_unread(email_id, rule_id, email_obj=None):
     """
     Mark an email as unread.
-    
+
     Args:
         email_id (int): ID of the email in the database
         rule_id (str): ID of the rule that triggered this action
-        
+        email_obj (Email): Pre-fetched Email row to reuse; loaded by ID
+                           when omitted
+
     Returns:
         dict: Result of the action
     """
-    session = get_session()
-    
-    try:
-        # Get email from database
-        email = session.query(Email).filter(Email.id == email_id).first()
-        
+    with session_scope() as session:
+        # Reuse the pre-fetched row if the dispatcher provided one,
+        # otherwise fall back to a primary-key lookup
+        if email_obj is not None:
+            email = session.merge(email_obj, load=False)
+        else:
+            email = session.get(Email, email_id)
+
         if not email:
             return {
                 'success': False,
                 'message': f"Email with ID {email_id} not found"
             }
-        
-        # Store necessary data before closing session
-        message_id = email.message_id
+
         subject = email.subject
-        is_already_unread = not email.is_read
-        
-    finally:
-        session.close()
-    
-    # Proceed with the action
-    if DRY_RUN:
-        log_action(email_id, 'mark_as_unread', rule_id, 
-                  f"Would mark email '{subject}' as unread (DRY RUN)")
-        
-        return {
-            'success': True,
-            'message': f"Would mark email '{subject}' as unread (DRY RUN)"
-        }
-    
-    # If email is already unread, skip
-    if is_already_unread:
-        log_action(email_id, 'mark_as_unread', rule_id, 
-                  f"Email '{subject}' is already marked as unread")
-        
-        return {
-            'success': True,
-            'message': f"Email is already marked as unread"
-        }
-    
-    try:
-        # Mark as unread in Gmail
-        service = get_gmail_service()
-        service.users().messages().modify(
-            userId='me',
-            id=message_id,
-            body={'addLabelIds': ['UNREAD']}
-        ).execute()
-        
-        # Update database
-        session = get_session()
+
+        if DRY_RUN:
+            log_action(email_id, 'mark_as_unread', rule_id,
+                      f"Would mark email '{subject}' as unread (DRY RUN)",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Would mark email '{subject}' as unread (DRY RUN)"
+            }
+
+        # If email is already unread, skip
+        if not _needs_modify('mark_as_unread', is_read=email.is_read):
+            log_action(email_id, 'mark_as_unread', rule_id,
+                      f"Email '{subject}' is already marked as unread",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Email is already marked as unread"
+            }
+
         try:
-            email = session.query(Email).filter(Email.id == email_id).first()
-            if email:
-                email.is_read = False
-                session.commit()
-        finally:
-            session.close()
-        
-        # Log action
-        log_action(email_id, 'mark_as_unread', rule_id, 
-                  f"Marked email '{subject}' as unread")
-        
-        return {
-            'success': True,
-            'message': f"Marked email as unread"
-        }
-    
-    except Exception as e:
-        # Log error
-        log_action(email_id, 'mark_as_unread', rule_id, 
-                  f"Failed to mark email as unread", 
-                  success=False, 
-                  error_message=str(e))
-        
-        return {
-            'success': False,
-            'message': f"Error: {str(e)}"
-        }
+            # Mark as unread in Gmail
+            service = get_gmail_service()
+            await _execute_request(service.users().messages().modify(
+                userId='me',
+                id=email.message_id,
+                body={'addLabelIds': ['UNREAD']}
+            ))
+
+            # Update database and log in the same transaction
+            email.is_read = False
+            log_action(email_id, 'mark_as_unread', rule_id,
+                      f"Marked email '{subject}' as unread",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Marked email as unread"
+            }
+
+        except Exception as e:
+            # Log error
+            log_action(email_id, 'mark_as_unread', rule_id,
+                      f"Failed to mark email as unread",
+                      success=False,
+                      error_message=str(e),
+                      session=session)
 
-def move_message(email_id, destination, rule_id):
+            return {
+                'success': False,
+                'message': f"Error: {str(e)}"
+            }
+
+async def move_message(email_id, destination, rule_id, email_obj=None):
     """
     Move an email to a different label.
-    
+
     Args:
         email_id (int): ID of the email in the database
         destination (str): Destination label
         rule_id (str): ID of the rule that triggered this action
-        
+        email_obj (Email): Pre-fetched Email row to reuse; loaded by ID
+                           when omitted
+
     Returns:
         dict: Result of the action
     """
-    session = get_session()
-    
-    try:
-        # Get email from database
-        email = session.query(Email).filter(Email.id == email_id).first()
-        
+    with session_scope() as session:
+        # Reuse the pre-fetched row if the dispatcher provided one,
+        # otherwise fall back to a primary-key lookup
+        if email_obj is not None:
+            email = session.merge(email_obj, load=False)
+        else:
+            email = session.get(Email, email_id)
+
         if not email:
             return {
                 'success': False,
                 'message': f"Email with ID {email_id} not found"
             }
-        
-        # Store necessary data before closing session
-        message_id = email.message_id
+
         subject = email.subject
-        current_labels = email.labels.split(',') if email.labels else []
-        
-    finally:
-        session.close()
-    
-    # Proceed with the action
-    if DRY_RUN:
-        log_action(email_id, 'move_message', rule_id, 
-                  f"Would move email '{subject}' to '{destination}' (DRY RUN)")
-        
-        return {
-            'success': True,
-            'message': f"Would move email '{subject}' to '{destination}' (DRY RUN)"
-        }
-    
-    try:
-        # Check if destination label exists, create if not
-        service = get_gmail_service()
-        
-        # Get list of all labels
-        results = service.users().labels().list(userId='me').execute()
-        labels = results.get('labels', [])
-        
-        # Check if destination label exists
-        label_id = None
-        for label in labels:
-            if label['name'].lower() == destination.lower():
-                label_id = label['id']
-                break
-        
-        # Create label if it doesn't exist
-        if not label_id:
-            label = service.users().labels().create(
+
+        if DRY_RUN:
+            log_action(email_id, 'move_message', rule_id,
+                      f"Would move email '{subject}' to '{destination}' (DRY RUN)",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Would move email '{subject}' to '{destination}' (DRY RUN)"
+            }
+
+        try:
+            # Resolve the destination label (cached, created if missing)
+            service = get_gmail_service()
+            loop = asyncio.get_running_loop()
+            label_id = await loop.run_in_executor(
+                None, _get_label_id, service, destination)
+
+            # If the label is already applied and the email has left the
+            # inbox, there's nothing for Gmail to do
+            labels = set(email.labels.split(',')) if email.labels else set()
+            if not _needs_modify('move_message', labels=labels, label_id=label_id):
+                log_action(email_id, 'move_message', rule_id,
+                          f"Email '{subject}' is already in '{destination}'",
+                          session=session)
+
+                return {
+                    'success': True,
+                    'message': f"Email is already in '{destination}'"
+                }
+
+            # Move message
+            await _execute_request(service.users().messages().modify(
                 userId='me',
+                id=email.message_id,
                 body={
-                    'name': destination,
-                    'labelListVisibility': 'labelShow',
-                    'messageListVisibility': 'show'
+                    'addLabelIds': [label_id],
+                    'removeLabelIds': ['INBOX']
                 }
-            ).execute()
-            label_id = label['id']
-        
-        # Move message
-        service.users().messages().modify(
-            userId='me',
-            id=message_id,
-            body={
-                'addLabelIds': [label_id],
-                'removeLabelIds': ['INBOX']
+            ))
+
+            # Update labels and log in the same transaction; a set gives
+            # constant-time membership checks and dedupes as a side effect
+            labels.discard('INBOX')
+            labels.add(label_id)
+            email.labels = ','.join(sorted(labels))
+
+            log_action(email_id, 'move_message', rule_id,
+                      f"Moved email '{subject}' to '{destination}'",
+                      session=session)
+
+            return {
+                'success': True,
+                'message': f"Moved email to '{destination}'"
             }
-        ).execute()
-        
-        # Update labels in database
-        session = get_session()
-        try:
-            email = session.query(Email).filter(Email.id == email_id).first()
-            if email:
-                labels = email.labels.split(',') if email.labels else []
-                
-                if 'INBOX' in labels:
-                    labels.remove('INBOX')
-                
-                if label_id not in labels:
-                    labels.append(label_id)
-                
-                email.labels = ','.join(labels)
-                session.commit()
-        finally:
-            session.close()
-        
-        # Log action
-        log_action(email_id, 'move_message', rule_id, 
-                  f"Moved email '{subject}' to '{destination}'")
-        
-        return {
-            'success': True,
-            'message': f"Moved email to '{destination}'"
-        }
-    
-    except Exception as e:
-        # Log error
-        log_action(email_id, 'move_message', rule_id, 
-                  f"Failed to move email to '{destination}'", 
-                  success=False, 
-                  error_message=str(e))
-        
-        return {
-            'success': False,
-            'message': f"Error: {str(e)}"
-        }
\ No newline at end of file
+
+        except Exception as e:
+            # Log error
+            log_action(email_id, 'move_message', rule_id,
+                      f"Failed to move email to '{destination}'",
+                      success=False,
+                      error_message=str(e),
+                      session=session)
+
+            return {
+                'success': False,
+                'message': f"Error: {str(e)}"
+            }
\ No newline at end of file
@@ -2,45 +2,176 @@
 Authentication module for Gmail API
 """
 
+import json
 import os
 import pickle
+import threading
+import httplib2
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
 from config import SCOPES, CREDENTIALS_FILE, TOKEN_FILE
 
+def _load_credentials():
+    """
+    Load stored credentials from the token file.
+
+    Tokens are stored as JSON; older token files written with pickle are
+    still read so existing installs keep working and get rewritten as
+    JSON on the next save.
+
+    Returns:
+        Credentials: The stored credentials, or None if no token file exists
+    """
+    if not os.path.exists(TOKEN_FILE):
+        return None
+
+    try:
+        with open(TOKEN_FILE, 'r') as token:
+            return Credentials.from_authorized_user_info(
+                json.load(token), SCOPES)
+    except (UnicodeDecodeError, ValueError):
+        # Legacy token file from the old pickle format
+        with open(TOKEN_FILE, 'rb') as token:
+            return pickle.load(token)
+
+def _save_credentials(creds):
+    """
+    Save credentials to the token file as JSON.
+
+    Args:
+        creds (Credentials): The credentials to persist
+    """
+    with open(TOKEN_FILE, 'w') as token:
+        token.write(creds.to_json())
+
+# Cached service object; building a Discovery resource is expensive, so
+# it's done once per process and reused while the credentials stay valid
+_SERVICE = None
+_SERVICE_CREDS = None
+_SERVICE_LOCK = threading.Lock()
+
+# Per-thread HTTP transport. httplib2.Http keeps per-host connection
+# state and is not thread-safe, so threads sharing the cached service
+# must not share its transport; each thread gets its own AuthorizedHttp
+_THREAD_HTTP = threading.local()
+
+def get_authorized_http(creds=None):
+    """
+    Return the calling thread's AuthorizedHttp, creating it on first use.
+
+    Args:
+        creds (Credentials): Credentials to bind the transport to;
+                             defaults to the cached service's credentials
+
+    Returns:
+        AuthorizedHttp: A transport owned by the calling thread
+    """
+    if creds is None:
+        creds = _SERVICE_CREDS
+
+    http = getattr(_THREAD_HTTP, 'http', None)
+    if http is None or http.credentials is not creds:
+        http = AuthorizedHttp(creds, http=httplib2.Http())
+        _THREAD_HTTP.http = http
+    return http
+
+def _thread_safe_request_builder(creds):
+    """
+    Build a requestBuilder that binds requests to per-thread transports.
+
+    The service object itself is safe to share — it's just the parsed
+    discovery document — but requests built from it would otherwise all
+    execute over the service's single http object. With this builder,
+    each request carries the transport of the thread that built it, so
+    concurrent executor threads never interleave on one socket. Batch
+    requests inherit the transport of their first sub-request and are
+    covered too.
+
+    Args:
+        creds (Credentials): Credentials to bind the transports to
+
+    Returns:
+        callable: A requestBuilder for googleapiclient.discovery.build
+    """
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(get_authorized_http(creds), *args, **kwargs)
+    return build_request
+
 def get_gmail_service():
     """
     Authenticate with Gmail API and return the service object.
-    
+
     This function handles the OAuth2 flow, including:
     - Loading existing credentials from token.json if available
     - Refreshing credentials if expired
     - Initiating the OAuth flow if no valid credentials exist
-    
+
+    The built service is cached at module level and returned directly on
+    subsequent calls while its credentials remain valid.
+
     Returns:
         The authenticated Gmail API service object
     """
-    creds = None
-    
-    # Check if token file exists with stored credentials
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    
-    # If no valid credentials available, let the user log in
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                CREDENTIALS_FILE, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        # Save the credentials for the next run
-        with open(TOKEN_FILE, 'wb') as token:
-            pickle.dump(creds, token)
-    
-    # Build and return the Gmail service
-    service = build('gmail', 'v1', credentials=creds)
-    return service
\ No newline at end of file
+    global _SERVICE, _SERVICE_CREDS
+
+    # Fast path: reuse the cached service while credentials stay valid
+    if _SERVICE is not None and _SERVICE_CREDS is not None and _SERVICE_CREDS.valid:
+        return _SERVICE
+
+    with _SERVICE_LOCK:
+        # Another thread may have rebuilt it while we waited on the lock
+        if _SERVICE is not None and _SERVICE_CREDS is not None and _SERVICE_CREDS.valid:
+            return _SERVICE
+
+        # Check if token file exists with stored credentials
+        creds = _load_credentials()
+
+        # If no valid credentials available, let the user log in
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    CREDENTIALS_FILE, SCOPES)
+                creds = flow.run_local_server(port=0)
+
+            # Save the credentials for the next run
+            _save_credentials(creds)
+
+        # Build and cache the Gmail service; static_discovery avoids an
+        # HTTP fetch of the discovery document on every build, and the
+        # request builder gives each thread its own transport
+        _SERVICE = build('gmail', 'v1', credentials=creds,
+                         cache_discovery=False, static_discovery=True,
+                         requestBuilder=_thread_safe_request_builder(creds))
+        _SERVICE_CREDS = creds
+        return _SERVICE
+
+def refresh_service_if_expired():
+    """
+    Rebuild the cached service if its credentials have expired.
+
+    Call before a long batch or concurrent fan-out so every sub-request
+    uses valid credentials instead of racing to re-auth mid-run. A no-op
+    when no service has been built yet.
+
+    Returns:
+        The cached Gmail API service object, or None if none exists
+    """
+    global _SERVICE, _SERVICE_CREDS
+
+    if _SERVICE_CREDS is None:
+        return _SERVICE
+
+    if not _SERVICE_CREDS.valid:
+        with _SERVICE_LOCK:
+            if _SERVICE_CREDS is not None and not _SERVICE_CREDS.valid:
+                _SERVICE = None
+                _SERVICE_CREDS = None
+        return get_gmail_service()
+
+    return _SERVICE
\ No newline at end of file
@@ -2,15 +2,46 @@
 Database operations for Gmail Rules Manager
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, select, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
 from datetime import datetime
 from config import DATABASE_URL
 
-# Create SQLAlchemy engine and session
-engine = create_engine(DATABASE_URL)
-Session = sessionmaker(bind=engine)
+# Create SQLAlchemy engine with a connection pool so sessions reuse
+# connections instead of opening a new one per operation
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={'check_same_thread': False},
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True,
+    pool_timeout=30
+)
+
+@event.listens_for(engine, 'connect')
+def _sqlite_pragmas(dbapi_conn, connection_record):
+    """
+    Tune SQLite on every new connection.
+
+    WAL mode turns each commit into a single log append instead of a
+    full rollback-journal fsync and lets readers run alongside the
+    writer; synchronous=NORMAL is safe in WAL mode and skips the
+    per-commit fsync.
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.close()
+
+# scoped_session hands back the same session within a thread, and
+# expire_on_commit=False keeps attribute access working after commit
+_session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+Session = scoped_session(_session_factory)
 Base = declarative_base()
 
 class Email(Base):
@@ -18,7 +49,7 @@ class Email(Base):
     __tablename__ = 'emails'
     
     id = Column(Integer, primary_key=True)
-    message_id = Column(String(255), unique=True, nullable=False)  # Gmail's unique message ID
+    message_id = Column(String(255), unique=True, nullable=False, index=True)  # Gmail's unique message ID
     thread_id = Column(String(255))
     from_address = Column(String(255))
     to_address = Column(Text)  # Could have multiple recipients
@@ -26,7 +57,7 @@ class Email(Base):
     snippet = Column(Text)  # Gmail provides a snippet of the message
     body_text = Column(Text, nullable=True)  # Full message text (if available)
     body_html = Column(Text, nullable=True)  # HTML version (if available)
-    received_date = Column(DateTime)
+    received_date = Column(DateTime, index=True)  # Date rules filter on this
     is_read = Column(Boolean, default=False)
     labels = Column(Text)  # Store labels as comma-separated string
     
@@ -40,7 +71,10 @@ class Email(Base):
 class ActionLog(Base):
     """Log of actions performed on emails"""
     __tablename__ = 'action_logs'
-    
+    __table_args__ = (
+        Index('ix_action_logs_email_id', 'email_id'),
+    )
+
     id = Column(Integer, primary_key=True)
     email_id = Column(Integer, ForeignKey('emails.id'))
     action_type = Column(String(50))  # e.g., 'mark_read', 'move_message'
@@ -64,6 +98,32 @@ def get_session():
     """Return a new database session"""
     return Session()
 
+@contextmanager
+def session_scope():
+    """
+    Provide a transactional scope around a series of operations.
+
+    Commits on clean exit, rolls back on exception, and always closes
+    the session. Use as:
+
+        with session_scope() as session:
+            ...
+
+    Each scope gets its own session from the factory (not the
+    thread-scoped one), so concurrent scopes on the same thread — e.g.
+    action handlers interleaved on the event loop — can't commit or
+    close each other's session.
+    """
+    session = _session_factory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 def store_email(email_data):
     """
     Store an email in the database.
@@ -74,48 +134,86 @@ def store_email(email_data):
     Returns:
         Email: The created or updated Email object
     """
-    session = get_session()
-    
     try:
-        # Check if email already exists
-        existing_email = session.query(Email).filter_by(
-            message_id=email_data['message_id']
-        ).first()
-        
-        if existing_email:
-            # Update existing email
-            for key, value in email_data.items():
-                if hasattr(existing_email, key):
-                    setattr(existing_email, key, value)
-            email = existing_email
-        else:
-            # Create new email
-            email = Email(**email_data)
-            session.add(email)
-        
-        session.commit()
-        
-        # Get ID before closing session
-        email_id = email.id
-        
-        # Create a new Email object with just the ID to return
-        # This avoids the "not bound to a Session" error
-        return_email = Email(id=email_id)
-        
-        return return_email
-    
+        with session_scope() as session:
+            # Check if email already exists (indexed lookup on message_id)
+            existing_email = session.execute(
+                select(Email).where(Email.message_id == email_data['message_id'])
+            ).scalar_one_or_none()
+
+            if existing_email:
+                # Update existing email
+                for key, value in email_data.items():
+                    if hasattr(existing_email, key):
+                        setattr(existing_email, key, value)
+                email = existing_email
+            else:
+                # Create new email
+                email = Email(**email_data)
+                session.add(email)
+
+            # Flush so a new email gets its ID assigned
+            session.flush()
+
+        # expire_on_commit=False keeps attributes readable after the
+        # session commits, so the live ORM object can be returned as-is
+        return email
+
     except Exception as e:
-        session.rollback()
         print(f"Error storing email: {e}")
         return None
-    
-    finally:
-        session.close()
 
-def log_action(email_id, action_type, rule_id, action_details, success=True, error_message=None):
+# Thread-local holder for the currently active ActionLogBuffer, if any
+_log_buffer_ctx = threading.local()
+
+class ActionLogBuffer:
+    """
+    Buffer for action log rows that writes them in a single bulk insert.
+
+    log_action commits one row per call; for a run with many actions
+    that means one fsync per log line. A buffer accumulates the rows in
+    memory and flushes them all at once with bulk_insert_mappings, so
+    the whole run costs a single commit.
+
+    While a buffer is active (between activate() and deactivate()),
+    log_action calls on the same thread are routed into it instead of
+    writing directly.
+    """
+
+    def __init__(self):
+        self._rows = []
+
+    def append(self, email_id, action_type, rule_id, action_details,
+               success=True, error_message=None):
+        """Add a log row to the buffer."""
+        self._rows.append({
+            'email_id': email_id,
+            'action_type': action_type,
+            'rule_id': rule_id,
+            'action_details': action_details,
+            'success': success,
+            'error_message': error_message,
+            'timestamp': datetime.utcnow()
+        })
+
+    def flush(self, session):
+        """Write all buffered rows in one bulk insert and clear the buffer."""
+        if self._rows:
+            session.bulk_insert_mappings(ActionLog, self._rows)
+            self._rows = []
+
+    def activate(self):
+        """Route log_action calls on this thread into this buffer."""
+        _log_buffer_ctx.buffer = self
+
+    def deactivate(self):
+        """Stop routing log_action calls into this buffer."""
+        _log_buffer_ctx.buffer = None
+
+def log_action(email_id, action_type, rule_id, action_details, success=True, error_message=None, session=None):
     """
     Log an action performed on an email.
-    
+
     Args:
         email_id (int): ID of the email
         action_type (str): Type of action performed
@@ -123,13 +221,23 @@ def log_action(email_id, action_type, rule_id, action_details, success=True, err
         action_details (str): Additional details about the action
         success (bool): Whether the action was successful
         error_message (str): Error message if the action failed
-        
+        session (Session): Existing session to add the log to. If given,
+                           the caller's transaction owns the commit;
+                           otherwise a new session is opened and committed.
+
     Returns:
-        ActionLog: The created ActionLog object
+        ActionLog: The created ActionLog object, or None if the log was
+                   routed into an active ActionLogBuffer
     """
-    session = get_session()
-    
-    try:
+    # Route through the active buffer if one is in scope
+    buffer = getattr(_log_buffer_ctx, 'buffer', None)
+    if buffer is not None:
+        buffer.append(email_id, action_type, rule_id, action_details,
+                      success=success, error_message=error_message)
+        return None
+
+    # Reuse the caller's session so the log rides along in its transaction
+    if session is not None:
         log = ActionLog(
             email_id=email_id,
             action_type=action_type,
@@ -138,26 +246,32 @@ def log_action(email_id, action_type, rule_id, action_details, success=True, err
             success=success,
             error_message=error_message
         )
-        
         session.add(log)
-        session.commit()
-        
-        # Get ID before closing session
-        log_id = log.id
-        
-        # Create a new ActionLog object with just the ID to return
-        # This avoids the "not bound to a Session" error
-        return_log = ActionLog(id=log_id)
-        
-        return return_log
-    
+        return log
+
+    try:
+        with session_scope() as session:
+            log = ActionLog(
+                email_id=email_id,
+                action_type=action_type,
+                rule_id=rule_id,
+                action_details=action_details,
+                success=success,
+                error_message=error_message
+            )
+
+            session.add(log)
+
+            # Flush so the log gets its ID assigned
+            session.flush()
+
+        # expire_on_commit=False keeps attributes readable after the
+        # session commits, so the live ORM object can be returned as-is
+        return log
+
     except Exception as e:
-        session.rollback()
         print(f"Error logging action: {e}")
         return None
-    
-    finally:
-        session.close()
 
 def get_email_by_id(email_id):
     """
@@ -169,10 +283,5 @@ def get_email_by_id(email_id):
     Returns:
         Email: The Email object, or None if not found
     """
-    session = get_session()
-    
-    try:
-        return session.query(Email).filter_by(id=email_id).first()
-    
-    finally:
-        session.close()
\ No newline at end of file
+    with session_scope() as session:
+        return session.get(Email, email_id)
\ No newline at end of file
@@ -4,79 +4,189 @@ Email fetching module for Gmail Rules Manager
 
 import base64
 import email
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from email.utils import parsedate_to_datetime
-from auth import get_gmail_service
+from auth import get_gmail_service, get_authorized_http
 from db import store_email, get_session
+from retry import gmail_execute, execute_batch
 from config import MAX_EMAILS_TO_FETCH
 
-def fetch_emails(limit=MAX_EMAILS_TO_FETCH):
+def _iter_message_pages(service, limit):
+    """
+    Yield pages of message dicts from messages().list, up to limit.
+
+    Pages are fetched lazily via list_next, so callers can start working
+    on the first page before the listing has finished.
+
+    Args:
+        service: The authenticated Gmail API service object
+        limit (int): Maximum total number of messages to yield
+
+    Yields:
+        list: Pages of message dicts from the Gmail API
+    """
+    request = service.users().messages().list(
+        userId='me',
+        maxResults=min(limit, 500),
+        labelIds=['INBOX']
+    )
+
+    yielded = 0
+    while request is not None and yielded < limit:
+        response = gmail_execute(request)
+        messages = response.get('messages', [])[:limit - yielded]
+
+        if messages:
+            yielded += len(messages)
+            yield messages
+
+        request = service.users().messages().list_next(request, response)
+
+def fetch_emails(limit=MAX_EMAILS_TO_FETCH, need_body=False):
     """
     Fetch emails from Gmail API and store them in the database.
-    
+
+    Message listing is paginated lazily and each page's details are
+    fetched with batch requests (up to 100 messages per HTTP call) on a
+    worker thread, so the batch-get for one page overlaps with listing
+    the next instead of running as two serial phases.
+
+    By default only message metadata (headers, labels, snippet) is
+    fetched, which is all the common rules need and is far smaller on
+    the wire than the full MIME tree. Pass need_body=True for rules
+    that match on message text.
+
     Args:
         limit (int): Maximum number of emails to fetch
-        
+        need_body (bool): Whether to fetch full message bodies
+
     Returns:
         list: List of email IDs that were fetched
     """
     # Get authenticated Gmail API service
     service = get_gmail_service()
-    
-    # Get list of messages
-    results = service.users().messages().list(
-        userId='me',
-        maxResults=limit,
-        labelIds=['INBOX']
-    ).execute()
-    
-    messages = results.get('messages', [])
-    
-    if not messages:
+
+    if need_body:
+        get_params = {'format': 'full'}
+    else:
+        get_params = {
+            'format': 'metadata',
+            'metadataHeaders': ['From', 'To', 'Subject', 'Date']
+        }
+
+    # Fetch message details in batches, collecting responses keyed by
+    # message ID so failures in one sub-request don't drop the rest
+    responses = {}
+
+    def collect_response(request_id, response, exception):
+        if exception is not None:
+            print(f"Error fetching message {request_id}: {exception}")
+        else:
+            responses[request_id] = response
+
+    def fetch_page(page):
+        # The worker batch-fetches page j while the main thread is still
+        # listing page j+1; executing the batch over the worker's own
+        # transport keeps the two legs from sharing connection state
+        requests = {
+            message['id']: service.users().messages().get(
+                userId='me',
+                id=message['id'],
+                **get_params
+            )
+            for message in page
+        }
+        execute_batch(service, requests, collect_response,
+                      http=get_authorized_http())
+
+    # Pipeline: the worker batch-fetches page j while the main thread
+    # lists page j+1
+    ordered_ids = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        futures = []
+        for page in _iter_message_pages(service, limit):
+            ordered_ids.extend(message['id'] for message in page)
+            futures.append(executor.submit(fetch_page, page))
+
+        for future in futures:
+            future.result()
+
+    if not ordered_ids:
         print("No messages found.")
         return []
-    
+
     email_ids = []
-    
-    # Process each message
-    for message in messages:
-        msg_id = message['id']
-        
-        # Get the message details
-        msg = service.users().messages().get(
-            userId='me', 
-            id=msg_id,
-            format='full'
-        ).execute()
-        
-        # Parse and store the email
-        email_data = parse_email(msg)
-        
+
+    # Parse and store each message in the order it was listed
+    for msg_id in ordered_ids:
+        msg = responses.get(msg_id)
+        if not msg:
+            continue
+
+        email_data = parse_email(msg, need_body=need_body)
+
         # Store in database - this function creates its own session
         stored_email = store_email(email_data)
         if stored_email:
             email_ids.append(stored_email.id)
-    
+
     return email_ids
 
-def parse_email(msg):
+def _walk_parts(parts):
+    """
+    Yield the leaf parts of a (possibly nested) multipart payload.
+
+    Real messages often nest text parts inside multipart/alternative or
+    multipart/mixed containers; a flat scan of the top-level parts
+    misses those bodies entirely.
+
+    Args:
+        parts (list): List of part dicts from a Gmail message payload
+
+    Yields:
+        dict: Leaf (non-multipart) part dicts
+    """
+    for part in parts:
+        if part.get('parts'):
+            yield from _walk_parts(part['parts'])
+        else:
+            yield part
+
+def _decode_body(data):
+    """
+    Decode a base64url-encoded message body.
+
+    Args:
+        data (str): The base64url data string from a part body
+
+    Returns:
+        str: The decoded body text
+    """
+    # urlsafe_b64decode accepts str directly; no need to encode first
+    return base64.urlsafe_b64decode(data).decode('utf-8', errors='replace')
+
+def parse_email(msg, need_body=True):
     """
     Parse email message from Gmail API response.
-    
+
     Args:
         msg (dict): Message dict from Gmail API
-        
+        need_body (bool): Whether to extract message bodies; pass False
+                          for metadata-format responses, which carry none
+
     Returns:
         dict: Parsed email data
     """
-    # Get headers
-    headers = {header['name']: header['value'] for header in msg['payload']['headers']}
-    
+    # Get headers, keyed by lowercased name — header casing varies
+    # between messages ('From' vs 'from'), and lookups shouldn't care
+    headers = {header['name'].lower(): header['value'] for header in msg['payload']['headers']}
+
     # Parse received date
     received_date = None
-    if 'Date' in headers:
+    if 'date' in headers:
         try:
-            received_date = parsedate_to_datetime(headers['Date'])
+            received_date = parsedate_to_datetime(headers['date'])
         except:
             received_date = datetime.utcnow()
     
@@ -86,37 +196,40 @@ def parse_email(msg):
     # Check if the email has been read
     is_read = 'UNREAD' not in msg.get('labelIds', [])
     
-    # Get message body
+    # Get message body, descending into nested multipart structures and
+    # stopping as soon as both a plain-text and an HTML body are found
     body_text = None
     body_html = None
-    
-    if 'parts' in msg['payload']:
-        for part in msg['payload']['parts']:
-            if part['mimeType'] == 'text/plain' and 'data' in part['body']:
-                body_text = base64.urlsafe_b64decode(
-                    part['body']['data'].encode('ASCII')
-                ).decode('utf-8')
-            elif part['mimeType'] == 'text/html' and 'data' in part['body']:
-                body_html = base64.urlsafe_b64decode(
-                    part['body']['data'].encode('ASCII')
-                ).decode('utf-8')
-    elif 'body' in msg['payload'] and 'data' in msg['payload']['body']:
-        body_data = base64.urlsafe_b64decode(
-            msg['payload']['body']['data'].encode('ASCII')
-        ).decode('utf-8')
-        
-        if msg['payload']['mimeType'] == 'text/plain':
-            body_text = body_data
-        elif msg['payload']['mimeType'] == 'text/html':
-            body_html = body_data
+
+    payload = msg['payload']
+    if need_body:
+        if 'parts' in payload:
+            for part in _walk_parts(payload['parts']):
+                if 'data' not in part.get('body', {}):
+                    continue
+
+                if body_text is None and part['mimeType'] == 'text/plain':
+                    body_text = _decode_body(part['body']['data'])
+                elif body_html is None and part['mimeType'] == 'text/html':
+                    body_html = _decode_body(part['body']['data'])
+
+                if body_text is not None and body_html is not None:
+                    break
+        elif 'body' in payload and 'data' in payload['body']:
+            body_data = _decode_body(payload['body']['data'])
+
+            if payload['mimeType'] == 'text/plain':
+                body_text = body_data
+            elif payload['mimeType'] == 'text/html':
+                body_html = body_data
     
     # Create email data dictionary
     email_data = {
         'message_id': msg['id'],
         'thread_id': msg['threadId'],
-        'from_address': headers.get('From', ''),
-        'to_address': headers.get('To', ''),
-        'subject': headers.get('Subject', '(No Subject)'),
+        'from_address': headers.get('from', ''),
+        'to_address': headers.get('to', ''),
+        'subject': headers.get('subject', '(No Subject)'),
         'snippet': msg.get('snippet', ''),
         'body_text': body_text,
         'body_html': body_html,
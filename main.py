@@ -23,6 +23,9 @@ def parse_args():
     
     parser.add_argument('--limit', type=int, default=20,
                         help='Maximum number of emails to fetch (default: 20)')
+
+    parser.add_argument('--fetch-bodies', action='store_true',
+                        help='Fetch full message bodies (needed for rules that match on message text)')
     
     parser.add_argument('--dry-run', action='store_true',
                         help='Do not actually perform actions, just simulate')
@@ -46,7 +49,7 @@ def main():
     email_ids = None
     if args.fetch:
         print(f"Fetching up to {args.limit} emails from Gmail...")
-        email_ids = fetch_emails(limit=args.limit)
+        email_ids = fetch_emails(limit=args.limit, need_body=args.fetch_bodies)
         print(f"Fetched {len(email_ids)} emails.")
     
     # Process emails if requested
@@ -68,10 +71,8 @@ def main():
             print("\nApplicable actions:")
             for email_id, actions in applicable_actions.items():
                 print(f"Email ID {email_id}:")
-                for action_info in actions:
-                    action = action_info['action']
-                    rule_id = action_info['rule_id']
-                    print(f"  - Rule {rule_id}: {action['type']}")
+                for applied in actions:
+                    print(f"  - Rule {applied.rule_id}: {applied.action['type']}")
         
         # Ask for confirmation
         response = input(f"\nFound {len(applicable_actions)} emails with applicable actions. Proceed? (y/n): ")
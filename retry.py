@@ -0,0 +1,102 @@
+"""
+Retry helpers for Gmail API calls
+"""
+
+import random
+import time
+from googleapiclient.errors import HttpError
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Cap on the exponential backoff delay
+MAX_BACKOFF_SECONDS = 32
+
+# Gmail's batch endpoint accepts at most 100 sub-requests per call
+BATCH_SIZE = 100
+
+def is_retryable(exception):
+    """
+    Check whether an exception is a retryable Gmail API error.
+
+    Args:
+        exception (Exception): The exception raised by a request
+
+    Returns:
+        bool: True for HTTP 429 and transient 5xx errors
+    """
+    return (isinstance(exception, HttpError)
+            and exception.resp.status in RETRYABLE_STATUS_CODES)
+
+def gmail_execute(request, max_attempts=5, http=None):
+    """
+    Execute a Gmail API request, retrying rate-limit and transient errors.
+
+    Retries use exponential backoff with jitter (2^attempt seconds,
+    capped, plus a random fraction) so a throttled run slows down
+    instead of failing outright.
+
+    Args:
+        request: A googleapiclient request object (not yet executed)
+        max_attempts (int): Maximum number of attempts before giving up
+        http: Transport to execute over instead of the request's own
+
+    Returns:
+        dict: The API response
+
+    Raises:
+        HttpError: If the error is not retryable or attempts run out
+    """
+    for attempt in range(max_attempts):
+        try:
+            return request.execute(http=http)
+        except HttpError as e:
+            if not is_retryable(e) or attempt == max_attempts - 1:
+                raise
+            time.sleep(min(2 ** attempt, MAX_BACKOFF_SECONDS) + random.random())
+
+def execute_batch(service, requests, callback, max_attempts=5, http=None):
+    """
+    Execute Gmail sub-requests in batches, retrying retryable failures.
+
+    Sub-requests are chunked into batch HTTP calls of up to 100 each.
+    Sub-requests that fail with a retryable status are requeued into a
+    follow-up batch after a backoff; all others are reported to the
+    callback immediately.
+
+    Args:
+        service: The authenticated Gmail API service object
+        requests (dict): Mapping of request_id -> un-executed request object
+        callback: Called as callback(request_id, response, exception) with
+                  the final outcome of each sub-request
+        max_attempts (int): Maximum number of attempts per sub-request
+        http: Transport to execute the batch calls over instead of the
+              one the sub-requests were built with
+    """
+    pending = dict(requests)
+
+    for attempt in range(max_attempts):
+        last_attempt = attempt == max_attempts - 1
+        retry_ids = []
+
+        def collect(request_id, response, exception):
+            if exception is not None and is_retryable(exception) and not last_attempt:
+                retry_ids.append(request_id)
+            else:
+                callback(request_id, response, exception)
+
+        request_ids = list(pending)
+        for i in range(0, len(request_ids), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=collect)
+
+            for request_id in request_ids[i:i + BATCH_SIZE]:
+                batch.add(pending[request_id], request_id=request_id)
+
+            # Retry the batch call itself on transport-level throttling
+            gmail_execute(batch, max_attempts=max_attempts, http=http)
+
+        if not retry_ids:
+            return
+
+        pending = {request_id: requests[request_id] for request_id in retry_ids}
+        time.sleep(min(2 ** attempt, MAX_BACKOFF_SECONDS) + random.random())
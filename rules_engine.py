@@ -3,189 +3,915 @@ Rules engine for Gmail Rules Manager
 """
 
 import json
+import os
 import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from db import get_session, Email, get_email_by_id
+
+# orjson parses JSON several times faster than the stdlib; fall back
+# quietly to json when it isn't installed
+try:
+    import orjson as _fast_json
+except ImportError:
+    _fast_json = None
+
+# pyahocorasick scans a string for every needle at once; without it,
+# each substring condition scans the field separately
+try:
+    import ahocorasick as _ahocorasick
+except ImportError:
+    _ahocorasick = None
+from sqlalchemy import and_, or_, false, func
+from db import session_scope, Email, get_email_by_id
+
+# Chunk size for IN (...) clauses and for streaming rows from the DB
+QUERY_CHUNK_SIZE = 1000
+
+# The first batch of a pass is evaluated in-process; later full
+# batches fan out to worker processes, at most this many in flight
+MAX_PENDING_BATCHES = (os.cpu_count() or 1) + 1
+
+# Columns the rules engine actually reads; fetched as lightweight row
+# tuples instead of full ORM instances
+EMAIL_COLUMNS = (
+    Email.id,
+    Email.from_address,
+    Email.to_address,
+    Email.subject,
+    Email.body_text,
+    Email.received_date,
+)
+
+# Lightweight picklable stand-in for a result row, used when batches
+# are shipped to worker processes; field order matches EMAIL_COLUMNS
+EmailRow = namedtuple('EmailRow', (
+    'id', 'from_address', 'to_address', 'subject', 'body_text',
+    'received_date'))
+
+# Relative evaluation cost per field: date checks are cheapest, short
+# header fields are cheap, and message bodies are the most expensive to
+# scan
+FIELD_COST = {
+    'received_date': 0,
+    'from': 1,
+    'to': 1,
+    'subject': 2,
+    'message': 4,
+}
+
+# Substring scans cost more than straight equality checks
+PREDICATE_COST = {
+    'equals': 0,
+    'does_not_equal': 0,
+    'less_than': 0,
+    'greater_than': 0,
+    'contains': 1,
+    'does_not_contain': 1,
+}
+
+# String predicates as callables, resolved once per condition at load
+# time instead of re-compared against every predicate name per email
+STRING_OPS = {
+    'contains': lambda field_value, value: value in field_value,
+    'does_not_contain': lambda field_value, value: value not in field_value,
+    'equals': lambda field_value, value: field_value == value,
+    'does_not_equal': lambda field_value, value: field_value != value,
+}
+
+def _date_delta(value, unit):
+    """
+    Precompute the age threshold for a date condition.
+
+    Args:
+        value (str): Condition value (e.g., '7')
+        unit (str): Unit of time ('days' or 'months')
+
+    Returns:
+        tuple: (timedelta for the condition's value, timedelta of one
+                unit), or (None, None) if the value isn't an integer
+    """
+    try:
+        value = int(value)
+    except ValueError:
+        return None, None
+
+    if unit == 'days':
+        step = timedelta(days=1)
+    elif unit == 'months':
+        # Approximate months as 30 days for simplicity
+        step = timedelta(days=30)
+    else:
+        raise ValueError(f"Unknown unit: {unit}")
+
+    return step * value, step
+
+# Parsed rules and their per-field automata keyed by (path, mtime_ns,
+# size), so constructing another RulesEngine over an unchanged file
+# skips the JSON parse and normalization entirely
+_RULES_CACHE = {}
+
+# One applicable action for an email: the action dict from the rules
+# file plus the id of the rule that produced it. A namedtuple is far
+# cheaper to allocate than a two-key dict and reads as .action/.rule_id
+Applied = namedtuple('Applied', ('rule_id', 'action'))
+
+# Columns addressable from rule conditions in SQL
+FIELD_COLUMNS = {
+    'from': Email.from_address,
+    'to': Email.to_address,
+    'subject': Email.subject,
+    'message': Email.body_text,
+}
+
+class Condition:
+    """
+    One rule condition, preprocessed for the hot path.
+
+    Slots instead of the parsed JSON dict: attribute access is a fixed
+    offset load rather than a hash lookup, and the per-condition memory
+    footprint is a fraction of a dict's. All derived forms — lowered
+    names and values, the bytes needle, the predicate callable, and
+    date thresholds — are computed once here.
+    """
+
+    __slots__ = ('field', 'predicate', 'value', 'unit', 'value_lower',
+                 'value_bytes', 'op', 'delta', 'unit_step', 'shared_id')
+
+    def __init__(self, raw):
+        self.field = raw['field'].lower()
+        self.predicate = raw['predicate'].lower()
+        self.value = raw['value']
+        self.unit = raw.get('unit', 'days')
+        self.value_lower = self.value.lower()
+        self.value_bytes = self.value_lower.encode('utf-8')
+        self.op = STRING_OPS.get(self.predicate)
+        if self.field == 'received_date':
+            self.delta, self.unit_step = _date_delta(self.value, self.unit)
+        else:
+            self.delta = None
+            self.unit_step = None
+        # Assigned during loading for conditions shared across rules
+        self.shared_id = None
+
+class Rule:
+    """
+    One rule, preprocessed for the hot path.
+
+    Carries the parsed conditions as Condition objects, sorted cheapest
+    first, plus the matcher compiled for this rule (or None when the
+    generic evaluation path applies).
+    """
+
+    __slots__ = ('id', 'predicate', 'conditions', 'actions', 'matcher',
+                 'contains_fields')
+
+    def __init__(self, raw):
+        self.id = raw['id']
+        self.predicate = raw['predicate']
+        # Evaluate cheap conditions first so short-circuiting settles a
+        # rule before touching expensive fields like the message body
+        # (stable sort, so author order breaks ties)
+        self.conditions = sorted(
+            (Condition(condition) for condition in raw['conditions']),
+            key=_condition_cost)
+        self.actions = raw['actions']
+        self.matcher = None
+        self.contains_fields = frozenset()
+
+def _condition_to_sql(condition, now):
+    """
+    Translate a condition into a SQLAlchemy filter expression.
+
+    Args:
+        condition (Condition): Condition to translate
+        now (datetime): Clock reading date conditions compare against
+
+    Returns:
+        A SQLAlchemy clause, or None if the condition can't be
+        expressed in SQL
+    """
+    if condition.field == 'received_date':
+        return _date_condition_to_sql(condition, now)
+
+    column = FIELD_COLUMNS.get(condition.field)
+    if column is None:
+        return None
+
+    # SQLite's lower() and LIKE only case-fold ASCII, while the Python
+    # path uses Unicode-aware str.lower(); keep conditions with
+    # non-ASCII values on the Python path so results don't depend on
+    # where the condition was evaluated
+    if not condition.value.isascii():
+        return None
+
+    predicate = condition.predicate
+    value = condition.value
+
+    # NULL columns compare like empty strings, matching the Python path
+    column = func.coalesce(column, '')
+
+    if predicate == 'contains':
+        return column.icontains(value, autoescape=True)
+    elif predicate == 'does_not_contain':
+        return ~column.icontains(value, autoescape=True)
+    elif predicate == 'equals':
+        return func.lower(column) == condition.value_lower
+    elif predicate == 'does_not_equal':
+        return func.lower(column) != condition.value_lower
+
+    return None
+
+def _date_condition_to_sql(condition, now):
+    """
+    Translate a date condition into an indexed range filter.
+
+    The cutoff is computed from the condition's precomputed threshold,
+    so the database scans the received_date index instead of Python
+    doing datetime arithmetic per email.
+
+    Args:
+        condition (Condition): Condition to translate
+        now (datetime): Clock reading to measure email age against
+
+    Returns:
+        A SQLAlchemy clause, or None if the predicate isn't a date
+        comparison
+    """
+    delta = condition.delta
+    if delta is None:
+        # Non-integer condition value; never matches
+        return false()
+
+    predicate = condition.predicate
+    if predicate == 'less_than':
+        # NULL received_date never satisfies the comparison, matching
+        # the Python path's treatment of missing dates
+        return Email.received_date > now - delta
+
+    if predicate == 'greater_than':
+        # An email counts as "more than N units old" once a whole
+        # further unit has elapsed, matching the old floor-division
+        # age arithmetic
+        return Email.received_date <= now - delta - condition.unit_step
+
+    return None
+
+def _rule_to_sql(rule, now):
+    """
+    Translate a rule into a single SQLAlchemy filter expression.
+
+    Args:
+        rule (Rule): Rule to translate
+        now (datetime): Clock reading date conditions compare against
+
+    Returns:
+        A SQLAlchemy clause combining the rule's conditions, or None if
+        any condition (or the rule predicate) can't be expressed in SQL
+    """
+    clauses = []
+    for condition in rule.conditions:
+        clause = _condition_to_sql(condition, now)
+        if clause is None:
+            return None
+        clauses.append(clause)
+
+    if not clauses:
+        return None
+
+    if rule.predicate == 'all':
+        return and_(*clauses)
+    elif rule.predicate == 'any':
+        return or_(*clauses)
+
+    return None
+
+def _build_automata(rules):
+    """
+    Build one Aho-Corasick automaton per field over the lowercased
+    needles of its substring conditions.
+
+    A single automaton scan finds every needle in a field in one pass,
+    replacing one substring scan per condition. Fields with fewer than
+    two needles are skipped — a lone needle is already a single scan.
+
+    Args:
+        rules (list): Preprocessed Rule objects
+
+    Returns:
+        dict: Field name -> automaton, empty when pyahocorasick isn't
+              installed or no field has enough needles
+    """
+    if _ahocorasick is None:
+        return {}
+
+    # The automaton can't represent the empty needle (every string
+    # contains it); conditions with an empty value stay on the plain
+    # substring scan, which handles them correctly
+    needles = {}
+    for rule in rules:
+        for condition in rule.conditions:
+            if (condition.predicate in ('contains', 'does_not_contain')
+                    and condition.value_lower
+                    and condition.field in FIELD_COLUMNS):
+                needles.setdefault(condition.field, set()).add(
+                    condition.value_lower)
+
+    automata = {}
+    for field, values in needles.items():
+        if len(values) < 2:
+            continue
+        automaton = _ahocorasick.Automaton()
+        for value in values:
+            automaton.add_word(value, value)
+        automaton.make_automaton()
+        automata[field] = automaton
+    return automata
+
+def _compile_matcher(rule, automaton_fields):
+    """
+    Generate a specialized batch matcher function for one rule.
+
+    A rule's shape — fields, predicates, values — is fixed once the
+    file is loaded, so a function with all of them baked in as literals
+    can be compiled once and reused. Each email then costs one
+    straight-line boolean expression with no attribute lookups or
+    predicate dispatch, short-circuiting left to right in condition
+    cost order.
+
+    Args:
+        rule (Rule): Preprocessed rule
+        automaton_fields: Fields covered by an Aho-Corasick automaton
+
+    Returns:
+        callable: (columns, dates, found, shared, now) -> set of
+                  matching batch indices, or None when the rule uses a
+                  field or predicate the generator doesn't handle
+    """
+    preamble = []
+    consts = {}
+    parts = []
+
+    for k, condition in enumerate(rule.conditions):
+        field = condition.field
+        predicate = condition.predicate
+
+        # Conditions other rules also use consult the shared result
+        # computed once per batch instead of re-evaluating
+        if condition.shared_id is not None:
+            sid = condition.shared_id
+            preamble.append(f'    _shared{sid} = shared[{sid}]')
+            parts.append(f'(i in _shared{sid})')
+            continue
+
+        if field == 'received_date':
+            if predicate not in ('less_than', 'greater_than'):
+                return None
+            if condition.delta is None:
+                # Non-integer condition value; never matches
+                parts.append('False')
+                continue
+            consts[f'_delta{k}'] = condition.delta
+            if predicate == 'less_than':
+                preamble.append(f'    _cutoff{k} = now - _delta{k}')
+                parts.append(
+                    f'(dates[i] is not None and dates[i] > _cutoff{k})')
+            else:
+                consts[f'_step{k}'] = condition.unit_step
+                preamble.append(f'    _cutoff{k} = now - _delta{k} - _step{k}')
+                parts.append(
+                    f'(dates[i] is not None and dates[i] <= _cutoff{k})')
+            continue
+
+        if field not in FIELD_COLUMNS:
+            return None
+
+        # Substring checks on automaton-scanned fields consult the
+        # per-email needle sets instead of re-scanning the text; the
+        # empty needle isn't in the automaton and uses the plain scan
+        if (field in automaton_fields
+                and condition.value_lower
+                and predicate in ('contains', 'does_not_contain')):
+            preamble.append(f'    _found_{field} = found[{field!r}]')
+            membership = 'in' if predicate == 'contains' else 'not in'
+            parts.append(
+                f'({condition.value_lower!r} {membership} _found_{field}[i])')
+            continue
+
+        if predicate not in STRING_OPS:
+            return None
+
+        # Literal in the same representation the column is built in
+        value = (condition.value_lower if field in automaton_fields
+                 else condition.value_bytes)
+        preamble.append(f'    _col_{field} = columns[{field!r}]')
+        if predicate == 'contains':
+            parts.append(f'({value!r} in _col_{field}[i])')
+        elif predicate == 'does_not_contain':
+            parts.append(f'({value!r} not in _col_{field}[i])')
+        elif predicate == 'equals':
+            parts.append(f'(_col_{field}[i] == {value!r})')
+        else:
+            parts.append(f'(_col_{field}[i] != {value!r})')
+
+    if rule.predicate == 'all':
+        expression = ' and '.join(parts) or 'True'
+    elif rule.predicate == 'any':
+        expression = ' or '.join(parts) or 'False'
+    else:
+        return None
+
+    lines = ['def _matcher(columns, dates, found, shared, now):']
+    # Hoist column/cutoff bindings, deduplicated in first-use order
+    lines.extend(dict.fromkeys(preamble))
+    lines.append(
+        f'    return {{i for i in range(len(dates)) if {expression}}}')
+
+    namespace = dict(consts)
+    exec(compile('\n'.join(lines), f"<rule {rule.id}>", 'exec'),
+         namespace)
+    return namespace['_matcher']
+
+def _condition_cost(condition):
+    """
+    Estimate the evaluation cost of a condition for ordering purposes.
+
+    Args:
+        condition (Condition): Condition to estimate
+
+    Returns:
+        int: Relative cost; lower means cheaper to evaluate
+    """
+    return (FIELD_COST.get(condition.field, 2)
+            + PREDICATE_COST.get(condition.predicate, 1))
+
+def _eval_chunk(rules_file, now, row_values):
+    """
+    Evaluate one batch of emails in a worker process.
+
+    Top-level and fed only picklable arguments: the worker rebuilds its
+    RulesEngine from the rules file (served from the per-process rules
+    cache after the first batch) and reconstructs lightweight rows from
+    the value tuples.
+
+    Args:
+        rules_file (str): Path to the rules JSON file
+        now (datetime): Clock reading shared by the whole pass
+        row_values (list): Plain tuples of EMAIL_COLUMNS values
+
+    Returns:
+        tuple: (batch email IDs, rule ID -> set of matched email IDs)
+    """
+    engine = RulesEngine(rules_file)
+    python_rules = [rule for rule in engine.rules
+                    if _rule_to_sql(rule, now) is None]
+    rows = [EmailRow(*values) for values in row_values]
+
+    matched = {}
+    ids = engine._evaluate_batch(python_rules, rows, matched, now)
+    return ids, matched
 
 class RulesEngine:
     """Rules engine for processing emails based on defined rules"""
-    
+
     def __init__(self, rules_file):
         """
         Initialize rules engine.
-        
+
         Args:
             rules_file (str): Path to the JSON file containing rules
         """
         self.rules_file = rules_file
-        self.rules = self._load_rules()
-    
+        self.rules, self._automata, self._shared_conditions = self._load_rules()
+
     def _load_rules(self):
         """
         Load rules from JSON file.
-        
+
         Returns:
-            list: List of rule dictionaries
+            tuple: (list of Rule objects, per-field automata dict,
+                    shared-condition id -> Condition)
         """
-        with open(self.rules_file, 'r') as f:
-            data = json.load(f)
-        return data['rules']
-    
+        # Serve from the cache unless the file has changed on disk
+        st = os.stat(self.rules_file)
+        cache_key = (self.rules_file, st.st_mtime_ns, st.st_size)
+        cached = _RULES_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Read as bytes; both parsers decode UTF-8 themselves
+        with open(self.rules_file, 'rb') as f:
+            raw = f.read()
+
+        data = _fast_json.loads(raw) if _fast_json is not None else json.loads(raw)
+
+        # Slotted Rule/Condition objects carry every precomputed form
+        # the hot path needs
+        rules = [Rule(raw_rule) for raw_rule in data['rules']]
+
+        automata = _build_automata(rules)
+
+        # Conditions repeated across rules get a shared id, so each is
+        # evaluated once per batch and consulted by every rule using it
+        counts = {}
+        for rule in rules:
+            for condition in rule.conditions:
+                key = (condition.field, condition.predicate,
+                       condition.value_lower, condition.unit)
+                counts[key] = counts.get(key, 0) + 1
+
+        shared_ids = {}
+        shared_conditions = {}
+        for rule in rules:
+            for condition in rule.conditions:
+                key = (condition.field, condition.predicate,
+                       condition.value_lower, condition.unit)
+                if counts[key] < 2:
+                    continue
+                if key not in shared_ids:
+                    shared_ids[key] = len(shared_ids)
+                    shared_conditions[shared_ids[key]] = condition
+                condition.shared_id = shared_ids[key]
+
+        # Compile a specialized matcher per rule; rules the generator
+        # can't handle keep the generic evaluation path. For 'all'
+        # rules, also note which fields a contains condition scans — an
+        # empty field can never contain anything (except the empty
+        # string, which every field contains), which settles the whole
+        # conjunction
+        for rule in rules:
+            rule.matcher = _compile_matcher(rule, automata.keys())
+            if rule.predicate == 'all':
+                rule.contains_fields = frozenset(
+                    condition.field for condition in rule.conditions
+                    if condition.predicate == 'contains'
+                    and condition.value
+                    and condition.field in FIELD_COLUMNS)
+
+        cached = (rules, automata, shared_conditions)
+        _RULES_CACHE[cache_key] = cached
+        return cached
+
+    def _iter_email_rows(self, session, email_ids):
+        """
+        Yield lightweight per-email rows for rule evaluation.
+
+        Rows carry only the columns the rules read, as plain tuples
+        rather than full ORM instances, and are streamed in chunks so
+        large batches don't build one huge IN clause or result set.
+
+        Args:
+            session: Database session to query with
+            email_ids (list): Email IDs to fetch, or None for all emails
+
+        Yields:
+            Row: Per-email rows with the EMAIL_COLUMNS fields
+        """
+        if email_ids:
+            for i in range(0, len(email_ids), QUERY_CHUNK_SIZE):
+                chunk = email_ids[i:i + QUERY_CHUNK_SIZE]
+                yield from session.query(*EMAIL_COLUMNS).filter(
+                    Email.id.in_(chunk))
+        else:
+            yield from session.query(*EMAIL_COLUMNS).yield_per(QUERY_CHUNK_SIZE)
+
     def evaluate_emails(self, email_ids=None):
         """
         Evaluate rules against emails in the database.
-        
+
         Args:
-            email_ids (list): List of email IDs to evaluate. 
+            email_ids (list): List of email IDs to evaluate.
                              If None, all emails will be evaluated.
-                             
+
         Returns:
             dict: Dictionary mapping email IDs to applicable actions
         """
-        session = get_session()
-        results = {}
-        
-        try:
-            # Query for emails
-            query = session.query(Email)
-            if email_ids:
-                query = query.filter(Email.id.in_(email_ids))
-            
-            emails = query.all()
-            
-            # Store necessary data to avoid session issues
-            email_data = []
-            for email in emails:
-                email_data.append({
-                    'id': email.id,
-                    'email': email
-                })
-            
-        finally:
-            session.close()
-        
-        # Process rules outside of the session
-        for data in email_data:
-            email_id = data['id']
-            email = data['email']
+        return dict(self.iter_evaluations(email_ids))
+
+    def iter_evaluations(self, email_ids=None):
+        """
+        Stream evaluation results instead of materializing them all.
+
+        SQL-translated rules run up front as one indexed query each;
+        the remaining rules are evaluated batch by batch, and every
+        batch's results are yielded before the next batch of rows is
+        fetched. Callers can start acting on the first emails while
+        later ones are still being read and evaluated, and peak memory
+        stays bounded by the batch size.
+
+        Args:
+            email_ids (list): List of email IDs to evaluate.
+                             If None, all emails will be evaluated.
+
+        Yields:
+            tuple: (email_id, applicable_actions) for each email with
+                   at least one matching rule
+        """
+        # One clock reading for the whole pass; every date condition,
+        # SQL or Python, measures email age against the same instant
+        now = datetime.utcnow()
+
+        # Split rules by whether their predicates translate to SQL; the
+        # database filters translated rules with one indexed query each,
+        # and only the remainder is evaluated row-by-row in Python
+        sql_rules = []
+        python_rules = []
+        for rule in self.rules:
+            clause = _rule_to_sql(rule, now)
+            if clause is not None:
+                sql_rules.append((rule, clause))
+            else:
+                python_rules.append(rule)
+
+        # Matched email IDs per rule ID
+        matched = {}
+
+        with session_scope() as session:
+            for rule, clause in sql_rules:
+                query = session.query(Email.id).filter(clause)
+                if email_ids:
+                    ids = set()
+                    for i in range(0, len(email_ids), QUERY_CHUNK_SIZE):
+                        chunk = email_ids[i:i + QUERY_CHUNK_SIZE]
+                        ids.update(row.id for row in
+                                   query.filter(Email.id.in_(chunk)))
+                else:
+                    ids = {row.id for row in query}
+                matched[rule.id] = ids
+
+            if python_rules:
+                # Evaluate in bounded batches: buffer a chunk of rows,
+                # run all rules over it condition-major, emit the
+                # batch's results, move on. The first batch runs
+                # in-process — most runs fit in one batch and never pay
+                # for a pool — and every later full batch is shipped to
+                # a worker process, with a bounded number in flight
+                executor = None
+                futures = []
+
+                def merge(future):
+                    batch_ids, part = future.result()
+                    for rule_id, ids in part.items():
+                        matched.setdefault(rule_id, set()).update(ids)
+                    return batch_ids
+
+                try:
+                    rows = []
+                    first_batch = True
+                    for email in self._iter_email_rows(session, email_ids):
+                        rows.append(email)
+                        if len(rows) < QUERY_CHUNK_SIZE:
+                            continue
+                        if first_batch:
+                            batch_ids = self._evaluate_batch(
+                                python_rules, rows, matched, now)
+                            yield from self._assemble(matched, batch_ids)
+                            first_batch = False
+                        else:
+                            if executor is None:
+                                executor = ProcessPoolExecutor()
+                            futures.append(executor.submit(
+                                _eval_chunk, self.rules_file, now,
+                                [tuple(row) for row in rows]))
+                            while len(futures) >= MAX_PENDING_BATCHES:
+                                yield from self._assemble(
+                                    matched, merge(futures.pop(0)))
+                        rows = []
+
+                    for future in futures:
+                        yield from self._assemble(matched, merge(future))
+                    futures = []
+
+                    if rows:
+                        batch_ids = self._evaluate_batch(
+                            python_rules, rows, matched, now)
+                        yield from self._assemble(matched, batch_ids)
+                finally:
+                    if executor is not None:
+                        executor.shutdown()
+                return
+
+        # No Python-path rules: every match came from the SQL queries
+        all_ids = set()
+        for ids in matched.values():
+            all_ids.update(ids)
+        yield from self._assemble(matched, sorted(all_ids))
+
+    def _assemble(self, matched, email_ids):
+        """
+        Yield (email_id, applicable_actions) for the given emails.
+
+        Args:
+            matched (dict): Rule ID -> set of matched email IDs
+            email_ids (list): Email IDs to assemble results for
+
+        Yields:
+            tuple: (email_id, actions) with actions in rule order,
+                   skipping emails no rule matched
+        """
+        for email_id in email_ids:
             applicable_actions = []
-            
-            # Check each rule
             for rule in self.rules:
-                if self._rule_applies(rule, email):
-                    # Rule applies, add its actions to the list
-                    for action in rule['actions']:
-                        applicable_actions.append({
-                            'action': action,
-                            'rule_id': rule['id']
-                        })
-            
+                if email_id in matched.get(rule.id, ()):
+                    for action in rule.actions:
+                        applicable_actions.append(Applied(rule.id, action))
             if applicable_actions:
-                results[email_id] = applicable_actions
-        
-        return results
-    
-    def _rule_applies(self, rule, email):
-        """
-        Check if a rule applies to an email.
-        
+                yield email_id, applicable_actions
+
+    def _evaluate_batch(self, rules, rows, matched, now):
+        """
+        Evaluate rules against a batch of email rows, condition-major.
+
+        Each condition is evaluated once across the whole batch into a
+        set of matching row indices, and the sets are combined per rule
+        with C-level intersection/union. That keeps both the scan and
+        the combination out of the per-(email, condition) interpreter
+        loop, and lets 'all' rules stop as soon as the running
+        intersection is empty.
+
         Args:
-            rule (dict): Rule dictionary
-            email (Email): Email object
-            
+            rules (list): Rules to evaluate in Python
+            rows (list): Email rows with the EMAIL_COLUMNS fields
+            matched (dict): Rule ID -> set of email IDs, updated in place
+            now (datetime): Clock reading date conditions compare against
+
         Returns:
-            bool: True if rule applies, False otherwise
-        """
-        conditions = rule['conditions']
-        predicate = rule['predicate']
-        
-        # Handle different predicates
-        if predicate == 'all':
-            # All conditions must match
-            return all(self._condition_matches(condition, email) for condition in conditions)
-        elif predicate == 'any':
-            # At least one condition must match
-            return any(self._condition_matches(condition, email) for condition in conditions)
-        else:
-            raise ValueError(f"Unknown predicate: {predicate}")
-    
-    def _condition_matches(self, condition, email):
+            list: The batch's email IDs, in row order
         """
-        Check if a condition matches an email.
-        
+        # Normalize each field exactly once per batch, stored as one
+        # parallel list per field (struct-of-arrays) so a condition
+        # walks a single homogeneous column instead of hopping between
+        # per-email dicts. Fields the automata scan stay str; the rest
+        # are encoded to UTF-8 bytes, whose substring search and
+        # equality run on the byte-level fast paths
+        columns = {}
+        for field, attr in (('from', 'from_address'), ('to', 'to_address'),
+                            ('subject', 'subject'), ('message', 'body_text')):
+            if field in self._automata:
+                columns[field] = [(getattr(email, attr) or '').lower()
+                                  for email in rows]
+            else:
+                columns[field] = [
+                    (getattr(email, attr) or '').lower().encode('utf-8')
+                    for email in rows
+                ]
+        ids = [email.id for email in rows]
+        dates = [email.received_date for email in rows]
+
+        # Multi-pattern pass: scan each automaton-covered column once
+        # per batch, collecting the set of needles found per email, so
+        # the substring conditions below become set lookups
+        found = {}
+        for field, automaton in self._automata.items():
+            if any(condition.field == field
+                   and condition.predicate in ('contains', 'does_not_contain')
+                   for rule in rules for condition in rule.conditions):
+                found[field] = [
+                    {needle for _, needle in automaton.iter(text)}
+                    for text in columns[field]
+                ]
+
+        # Common-subexpression pass: evaluate each condition shared by
+        # several rules once per batch; matchers and the generic path
+        # below consult these by id
+        shared = {}
+        for rule in rules:
+            for condition in rule.conditions:
+                sid = condition.shared_id
+                if sid is not None and sid not in shared:
+                    shared[sid] = self._condition_match_set(
+                        self._shared_conditions[sid], columns, dates,
+                        found, now)
+
+        # Fields empty for every email in the batch — message bodies
+        # are, whenever emails were fetched metadata-only. An 'all'
+        # rule with a contains condition on such a field can't match
+        # anything here, so it skips the batch outright
+        empty_columns = {field for field, column in columns.items()
+                         if not any(column)}
+
+        for rule in rules:
+            if rule.contains_fields & empty_columns:
+                matched.setdefault(rule.id, set())
+                continue
+
+            predicate = rule.predicate
+            if rule.matcher is not None:
+                matching = rule.matcher(columns, dates, found, shared, now)
+            elif predicate == 'all':
+                # Intersect as we go; an empty running set settles the
+                # rule without evaluating the remaining (costlier)
+                # conditions
+                matching = None
+                for condition in rule.conditions:
+                    sid = condition.shared_id
+                    cond_set = (shared[sid] if sid is not None
+                                else self._condition_match_set(
+                                    condition, columns, dates, found, now))
+                    matching = (cond_set if matching is None
+                                else matching & cond_set)
+                    if not matching:
+                        break
+                if matching is None:
+                    matching = set(range(len(rows)))
+            elif predicate == 'any':
+                matching = set()
+                for condition in rule.conditions:
+                    sid = condition.shared_id
+                    matching |= (shared[sid] if sid is not None
+                                 else self._condition_match_set(
+                                     condition, columns, dates, found, now))
+            else:
+                raise ValueError(f"Unknown predicate: {predicate}")
+
+            rule_matched = matched.setdefault(rule.id, set())
+            for i in matching:
+                rule_matched.add(ids[i])
+
+        return ids
+
+    def _condition_match_set(self, condition, columns, dates, found, now):
+        """
+        Evaluate one condition across a batch of emails.
+
         Args:
-            condition (dict): Condition dictionary
-            email (Email): Email object
-            
+            condition (Condition): Condition to evaluate
+            columns (dict): Normalized field columns, each a list with
+                            one value per email (UTF-8 bytes, or str
+                            for automaton-scanned fields)
+            dates (list): received_date values, one per email
+            found (dict): Field -> per-email sets of automaton-matched
+                          needles, for fields covered by an automaton
+            now (datetime): Clock reading date conditions compare against
+
         Returns:
-            bool: True if condition matches, False otherwise
-        """
-        field = condition['field'].lower()
-        predicate = condition['predicate'].lower()
-        value = condition['value']
-        
-        # Get field value from email
-        if field == 'from':
-            field_value = email.from_address
-        elif field == 'to':
-            field_value = email.to_address
-        elif field == 'subject':
-            field_value = email.subject
-        elif field == 'message':
-            field_value = email.body_text or ""
-        elif field == 'received_date':
-            return self._check_date_condition(predicate, value, condition.get('unit', 'days'), email.received_date)
-        else:
+            set: Indices of the emails in the batch that match
+        """
+        field = condition.field
+        predicate = condition.predicate
+
+        if field == 'received_date':
+            return self._date_match_set(condition, dates, now)
+
+        column = columns.get(field)
+        if column is None:
             raise ValueError(f"Unknown field: {field}")
-        
-        # Check string conditions
-        if predicate == 'contains':
-            return value.lower() in field_value.lower()
-        elif predicate == 'does_not_contain':
-            return value.lower() not in field_value.lower()
-        elif predicate == 'equals':
-            return value.lower() == field_value.lower()
-        elif predicate == 'does_not_equal':
-            return value.lower() != field_value.lower()
-        else:
+
+        # Substring checks against an automaton-scanned field are set
+        # lookups on the needles already found in that email; the empty
+        # needle isn't in the automaton and uses the plain scan below
+        needle_sets = found.get(field)
+        if needle_sets is not None and condition.value_lower:
+            value = condition.value_lower
+            if predicate == 'contains':
+                return {i for i, needles in enumerate(needle_sets)
+                        if value in needles}
+            elif predicate == 'does_not_contain':
+                return {i for i, needles in enumerate(needle_sets)
+                        if value not in needles}
+
+        op = condition.op
+        if op is None:
             raise ValueError(f"Unknown predicate: {predicate}")
-    
-    def _check_date_condition(self, predicate, value, unit, email_date):
+
+        # Compare in whichever representation the column was built in
+        value = (condition.value_lower if field in self._automata
+                 else condition.value_bytes)
+        return {i for i, field_value in enumerate(column)
+                if op(field_value, value)}
+
+    def _date_match_set(self, condition, dates, now):
         """
-        Check a date condition.
-        
+        Evaluate one date condition across a batch of emails.
+
+        The cutoff datetime is computed once from the pass-wide clock
+        reading and the condition's precomputed threshold, so the
+        per-email check is a single datetime comparison.
+
         Args:
-            predicate (str): Predicate type ('less_than' or 'greater_than')
-            value (str): Value to compare with (e.g., '7')
-            unit (str): Unit of time ('days' or 'months')
-            email_date (datetime): The email's received date
-            
+            condition (Condition): Condition to evaluate
+            dates (list): received_date values, one per email
+            now (datetime): Clock reading to measure email age against
+
         Returns:
-            bool: True if condition matches, False otherwise
-        """
-        if not email_date:
-            return False
-        
-        try:
-            value = int(value)
-        except ValueError:
-            return False
-        
-        now = datetime.utcnow()
-        
-        # Calculate time difference
-        if unit == 'days':
-            time_diff = (now - email_date).days
-        elif unit == 'months':
-            # Approximate months as 30 days for simplicity
-            time_diff = (now - email_date).days // 30
-        else:
-            raise ValueError(f"Unknown unit: {unit}")
-        
-        # Check the condition
+            set: Indices of the emails in the batch that match
+        """
+        delta = condition.delta
+        if delta is None:
+            # Non-integer condition value; never matches
+            return set()
+
+        predicate = condition.predicate
         if predicate == 'less_than':
-            return time_diff < value
+            cutoff = now - delta
+            return {i for i, date in enumerate(dates)
+                    if date is not None and date > cutoff}
         elif predicate == 'greater_than':
-            return time_diff > value
+            # An email counts as "more than N units old" once a whole
+            # further unit has elapsed, matching the old floor-division
+            # age arithmetic
+            cutoff = now - delta - condition.unit_step
+            return {i for i, date in enumerate(dates)
+                    if date is not None and date <= cutoff}
         else:
-            raise ValueError(f"Unknown date predicate: {predicate}")
\ No newline at end of file
+            raise ValueError(f"Unknown date predicate: {predicate}")